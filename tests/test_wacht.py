@@ -1,15 +1,21 @@
 """Tests for wacht live reload server."""
 
+import gzip
+import http.server
 import os
 import sys
 import tempfile
+import threading
 import unittest
+import urllib.error
+import urllib.request
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from wacht import ReloadServer, ReloadHandler, get_mtime, get_pid_file, __version__
+from wacht import _FileIndex, _gzip_cache, _gzip_file, _mime, _scan_mtime
 
 
 class TestGetMtime(unittest.TestCase):
@@ -34,19 +40,200 @@ class TestGetMtime(unittest.TestCase):
             self.assertIn("a.txt", result)
             self.assertIn("b.txt", result)
 
+    def test_skips_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "sub").mkdir()
+            Path(tmp, "a.txt").write_text("a")
+            self.assertEqual(list(get_mtime(tmp)), ["a.txt"])
+
+    def test_missing_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(get_mtime(os.path.join(tmp, "missing")), {})
+
+    def test_follows_symlinks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "a.txt").write_text("a")
+            os.symlink(Path(tmp, "a.txt"), Path(tmp, "link.txt"))
+            os.symlink(Path(tmp, "missing"), Path(tmp, "broken.txt"))
+            self.assertEqual(sorted(get_mtime(tmp)), ["a.txt", "link.txt"])
+
+    def test_scandir_fallback_matches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "sub").mkdir()
+            Path(tmp, "a.txt").write_text("a")
+            self.assertEqual(_scan_mtime(tmp), get_mtime(tmp))
+            self.assertEqual(_scan_mtime(os.path.join(tmp, "missing")), {})
+
+
+class TestFileIndex(unittest.TestCase):
+    def test_initial_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "a.txt").write_text("a")
+            index = _FileIndex(tmp)
+            self.assertEqual(index.mtimes, get_mtime(tmp))
+            self.assertEqual(index.revision, 0)
+
+    def test_rescan_bumps_revision(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            index.rescan()
+            self.assertEqual(index.revision, 0)
+            Path(tmp, "a.txt").write_text("a")
+            index.rescan()
+            self.assertEqual(index.revision, 1)
+            self.assertIn("a.txt", index.mtimes)
+
+    def test_event_updates_entry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            path = Path(tmp, "a.txt")
+            path.write_text("a")
+            event = Mock(is_directory=False, event_type="created", src_path=str(path))
+            event.dest_path = ""
+            index.on_any_event(event)
+            self.assertIn("a.txt", index.mtimes)
+            path.unlink()
+            event.event_type = "deleted"
+            index.on_any_event(event)
+            self.assertNotIn("a.txt", index.mtimes)
+
+    def test_events_debounced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            index._watching = True
+            etag = index.etag
+            for i in range(10):
+                path = Path(tmp, f"{i}.txt")
+                path.write_text("x")
+                event = Mock(is_directory=False, event_type="created")
+                event.src_path, event.dest_path = str(path), ""
+                index.on_any_event(event)
+            self.assertEqual(index.revision, 0)
+            self.assertTrue(index.wait(etag, timeout=5))
+            self.assertEqual(index.revision, 1)
+            self.assertEqual(len(index.mtimes), 10)
+
+    @patch.dict(os.environ, {"WACHT_POLL": ""})
+    @patch("wacht.PollingObserver")
+    @patch("wacht.Observer")
+    def test_start_uses_observer(self, observer, polling_observer):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            index.start()
+            observer.return_value.schedule.assert_called_once_with(
+                index, tmp, recursive=False
+            )
+            observer.return_value.start.assert_called_once_with()
+            polling_observer.assert_not_called()
+            self.assertIs(index._observer, observer.return_value)
+
+    @patch.dict(os.environ, {"WACHT_POLL": "1"})
+    @patch("wacht.PollingObserver")
+    @patch("wacht.Observer")
+    def test_start_polling_forced(self, observer, polling_observer):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            index.start()
+            observer.assert_not_called()
+            polling_observer.return_value.start.assert_called_once_with()
+            self.assertIs(index._observer, polling_observer.return_value)
+
+    @patch.dict(os.environ, {"WACHT_POLL": ""})
+    @patch("wacht.PollingObserver")
+    @patch("wacht.Observer")
+    def test_start_polling_on_oserror(self, observer, polling_observer):
+        observer.return_value.schedule.side_effect = OSError("inotify limit")
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            index.start()
+            polling_observer.return_value.start.assert_called_once_with()
+            self.assertIs(index._observer, polling_observer.return_value)
+
+    @patch("wacht.Observer", None)
+    def test_start_without_watchdog(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp, interval=0.01)
+            index.start()
+            try:
+                self.assertIsNone(index._observer)
+                etag = index.etag
+                Path(tmp, "a.txt").write_text("a")
+                self.assertTrue(index.wait(etag, timeout=5))
+                self.assertIn("a.txt", index.mtimes)
+            finally:
+                index.stop()
+
+    def test_json_cached_until_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            data = index.as_json()
+            self.assertEqual(data, b"{}")
+            self.assertIs(index.as_json(), data)
+            Path(tmp, "a.txt").write_text("a")
+            index.rescan()
+            self.assertIn(b'"a.txt"', index.as_json())
+
+    def test_ignores_opened_event(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = _FileIndex(tmp)
+            event = Mock(is_directory=False, event_type="opened", src_path=tmp)
+            index.on_any_event(event)
+            self.assertEqual(index.revision, 0)
+
+
+class TestMime(unittest.TestCase):
+    def test_known_extensions(self):
+        self.assertEqual(_mime(".css"), "text/css")
+        self.assertEqual(_mime(".png"), "image/png")
+
+    def test_unknown_extension(self):
+        self.assertEqual(_mime(".nope"), "application/octet-stream")
+        self.assertEqual(_mime(""), "application/octet-stream")
+
+
+class TestGzipFile(unittest.TestCase):
+    def test_keeps_latest_version_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bundle.js")
+            Path(path).write_text("a" * 1000)
+            st = os.stat(path)
+            self.assertEqual(
+                gzip.decompress(_gzip_file(path, st.st_mtime_ns, st.st_size)),
+                b"a" * 1000,
+            )
+            Path(path).write_text("b" * 2000)
+            st = os.stat(path)
+            data = _gzip_file(path, st.st_mtime_ns, st.st_size)
+            self.assertEqual(gzip.decompress(data), b"b" * 2000)
+            self.assertEqual(_gzip_cache[path], (st.st_mtime_ns, st.st_size, data))
+            self.assertIs(_gzip_file(path, st.st_mtime_ns, st.st_size), data)
+            del _gzip_cache[path]
+
 
 class TestGetPidFile(unittest.TestCase):
+    def setUp(self):
+        get_pid_file.cache_clear()
+
     def test_returns_path(self):
         pid_file = get_pid_file()
         self.assertIsInstance(pid_file, Path)
         self.assertTrue(pid_file.name.endswith(".pid"))
 
-    def test_creates_directory(self):
-        pid_file = get_pid_file()
-        self.assertTrue(pid_file.parent.exists())
+    def test_does_not_create_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["XDG_RUNTIME_DIR"] = tmp
+            pid_file = get_pid_file()
+            self.assertEqual(pid_file.parent, Path(tmp) / "wacht")
+            self.assertFalse(pid_file.parent.exists())
+
+    def test_cached(self):
+        self.assertIs(get_pid_file(), get_pid_file())
 
 
 class TestReloadServer(unittest.TestCase):
+    def setUp(self):
+        get_pid_file.cache_clear()
+
     def test_init_defaults(self):
         server = ReloadServer()
         self.assertEqual(server.port, 8080)
@@ -58,6 +245,24 @@ class TestReloadServer(unittest.TestCase):
             self.assertEqual(server.port, 3000)
             self.assertEqual(server.webroot, Path(tmp).resolve())
 
+    def test_shared_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "a.txt").write_text("a")
+            server = ReloadServer(webroot=tmp)
+            server._index = _FileIndex(server.webroot)
+            with patch("wacht.ReloadHandler") as handler:
+                server._handler_factory("request", "address", "server")
+            kwargs = handler.call_args.kwargs
+            self.assertIs(kwargs["index"], server._index)
+            self.assertIs(kwargs["webroot"], server.webroot)
+            self.assertEqual(kwargs["webroot_str"], str(Path(tmp).resolve()))
+
+    def test_init_does_not_scan(self):
+        with patch("wacht.get_mtime") as mock_get_mtime:
+            server = ReloadServer()
+        self.assertIsNone(server._index)
+        mock_get_mtime.assert_not_called()
+
     def test_stop_no_pid_file(self):
         with tempfile.TemporaryDirectory() as tmp:
             os.environ["XDG_RUNTIME_DIR"] = tmp
@@ -66,6 +271,19 @@ class TestReloadServer(unittest.TestCase):
                 server.stop()
             self.assertEqual(cm.exception.code, 1)
 
+    @patch("os.posix_spawn", return_value=4242)
+    def test_start_daemon_writes_pid(self, mock_spawn):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["XDG_RUNTIME_DIR"] = tmp
+            server = ReloadServer(port=3000, webroot=tmp)
+            with patch("sys.stdout"):
+                server.start(daemon=True)
+            pid_file = Path(tmp) / "wacht" / "wacht.pid"
+            self.assertEqual(pid_file.read_text(), "4242")
+            argv = mock_spawn.call_args.args[1]
+            self.assertIn("--detached", argv)
+            self.assertEqual(argv[-1], str(Path(tmp).resolve()))
+
     @patch("os.kill")
     @patch("sys.exit")
     def test_stop_success(self, mock_exit, mock_kill):
@@ -84,6 +302,7 @@ class TestReloadHandler(unittest.TestCase):
         self.tmpdir = tempfile.mkdtemp()
         self.handler = ReloadHandler.__new__(ReloadHandler)
         self.handler.webroot = Path(self.tmpdir)
+        self.handler._webroot_str = self.tmpdir
 
     def tearDown(self):
         import shutil
@@ -102,6 +321,179 @@ class TestReloadHandler(unittest.TestCase):
         # But shouldn't escape webroot - it should be within tmpdir
         self.assertTrue(result.startswith(self.tmpdir))
 
+    def test_translate_path_encoded_traversal_blocked(self):
+        result = self.handler.translate_path("/%2e%2e/%2E%2E/etc/passwd")
+        self.assertEqual(result, os.path.join(self.tmpdir, "etc", "passwd"))
+
+    def test_translate_path_strips_query(self):
+        result = self.handler.translate_path("/app.js?v=2#top")
+        self.assertEqual(result, os.path.join(self.tmpdir, "app.js"))
+
+    def test_translate_path_unquotes(self):
+        result = self.handler.translate_path("/my%20file.txt")
+        self.assertEqual(result, os.path.join(self.tmpdir, "my file.txt"))
+
+
+class QuietHandler(ReloadHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHandlerHTTP(unittest.TestCase):
+    """Exercise ReloadHandler over a real socket."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = _FileIndex(self.tmpdir)
+        self.index._watching = True
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            lambda *a, **kw: QuietHandler(
+                *a, webroot=Path(self.tmpdir), index=self.index, **kw
+            ),
+        )
+        serve = lambda: self.server.serve_forever(poll_interval=0.01)
+        threading.Thread(target=serve, daemon=True).start()
+
+    def tearDown(self):
+        import shutil
+
+        self.index.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def get(self, path, headers=None):
+        url = f"http://127.0.0.1:{self.server.server_port}{path}"
+        try:
+            request = urllib.request.Request(url, headers=headers or {})
+            resp = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as e:
+            resp = e
+        self.addCleanup(resp.close)
+        return resp
+
+    def test_mtimes_etag(self):
+        resp = self.get("/.mtimes")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.headers["ETag"], 'W/"0"')
+
+    def test_mtimes_with_query(self):
+        resp = self.get("/.mtimes?t=1")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.headers["Content-type"], "application/json")
+
+    def test_html_with_query(self):
+        Path(self.tmpdir, "page.html").write_text("<body>hi</body>")
+        self.assertIn(b"/.wacht.js", self.get("/page.html?v=2").read())
+
+    def test_mtimes_not_modified(self):
+        resp = self.get("/.mtimes", {"If-None-Match": 'W/"0"'})
+        self.assertEqual(resp.status, 304)
+        self.assertEqual(resp.read(), b"")
+
+    def test_mtimes_modified(self):
+        self.index.revision += 1
+        resp = self.get("/.mtimes", {"If-None-Match": 'W/"0"'})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.headers["ETag"], 'W/"1"')
+
+    def test_html_injection(self):
+        Path(self.tmpdir, "page.html").write_text("<html><body>hi</body></html>")
+        data = self.get("/page.html").read()
+        self.assertTrue(data.startswith(b'<html><body>hi<script src="/.wacht.js?v='))
+        self.assertIn(b'data-etag="W/&quot;0&quot;" defer></script></body>', data)
+
+    def test_html_without_body(self):
+        Path(self.tmpdir, "page.html").write_text("<p>hi</p>")
+        data = self.get("/page.html").read()
+        self.assertTrue(data.startswith(b"<p>hi</p><script "))
+
+    def test_default_index(self):
+        data = self.get("/").read()
+        self.assertIn(b"<h1>Wacht</h1>", data)
+        self.assertIn(b'<script src="/.wacht.js', data)
+
+    def test_reload_script(self):
+        resp = self.get("/.wacht.js?v=1")
+        self.assertEqual(resp.headers["Content-Type"], "text/javascript")
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn(b"EventSource", resp.read())
+        resp = self.get("/.wacht.js", {"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(resp.status, 304)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+
+    def test_index_html(self):
+        Path(self.tmpdir, "index.htm").write_text("<body>home</body>")
+        self.index.rescan()
+        self.assertIn(b"<body>home<script ", self.get("/").read())
+
+    def test_file_not_modified(self):
+        Path(self.tmpdir, "style.css").write_text("body {}")
+        resp = self.get("/style.css")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.read(), b"body {}")
+        self.assertEqual(resp.headers["Content-Type"], "text/css")
+        etag, last_modified = resp.headers["ETag"], resp.headers["Last-Modified"]
+        resp = self.get("/style.css", {"If-None-Match": etag})
+        self.assertEqual(resp.status, 304)
+        self.assertEqual(resp.headers["Vary"], "Accept-Encoding")
+        resp = self.get("/style.css", {"If-Modified-Since": last_modified})
+        self.assertEqual(resp.status, 304)
+
+    def test_file_modified(self):
+        path = Path(self.tmpdir, "style.css")
+        path.write_text("body {}")
+        etag = self.get("/style.css").headers["ETag"]
+        path.write_text("body { color: red }")
+        resp = self.get("/style.css", {"If-None-Match": etag})
+        self.assertEqual(resp.status, 200)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+    def test_file_gzip(self):
+        css = b"body { color: red }\n" * 100
+        Path(self.tmpdir, "style.css").write_bytes(css)
+        resp = self.get("/style.css", {"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertTrue(resp.headers["ETag"].endswith('-gz"'))
+        self.assertEqual(gzip.decompress(resp.read()), css)
+        resp = self.get("/style.css")
+        self.assertIsNone(resp.headers["Content-Encoding"])
+        self.assertEqual(resp.read(), css)
+
+    def test_binary_not_gzipped(self):
+        Path(self.tmpdir, "logo.png").write_bytes(b"\x89PNG" * 100)
+        resp = self.get("/logo.png", {"Accept-Encoding": "gzip"})
+        self.assertIsNone(resp.headers["Content-Encoding"])
+
+    def test_html_gzip(self):
+        page = "<html><body>" + "<p>hi</p>" * 50 + "</body></html>"
+        Path(self.tmpdir, "page.html").write_text(page)
+        resp = self.get("/page.html", {"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn(b"/.wacht.js", gzip.decompress(resp.read()))
+
+    def test_directory_not_found(self):
+        os.mkdir(Path(self.tmpdir, "sub"))
+        self.assertEqual(self.get("/sub").status, 404)
+
+    def test_events_push_reload(self):
+        resp = self.get("/.events")
+        self.assertEqual(resp.headers["Content-Type"], "text/event-stream")
+        Path(self.tmpdir, "a.txt").write_text("a")
+        self.index.rescan()
+        self.assertEqual(resp.readline(), b"data: reload\n")
+
+    def test_events_stale_etag(self):
+        self.index.revision += 1
+        resp = self.get("/.events?etag=W%2F%220%22")
+        self.assertEqual(resp.readline(), b"data: reload\n")
+
+    def test_events_end_on_stop(self):
+        resp = self.get("/.events")
+        self.index.stop()
+        self.assertEqual(resp.read(), b"")
+
 
 class TestIntegration(unittest.TestCase):
     def test_server_lifecycle(self):
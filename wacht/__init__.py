@@ -5,34 +5,53 @@ A simple HTTP server with automatic browser reload when files change.
 
 __version__ = "0.1.0"
 
+import email.utils
+import gzip
+import hashlib
+import html
 import http.server
+import io
 import json
+import mimetypes
 import os
+import re
+import shutil
 import signal
-import socketserver
+import stat
 import sys
 import threading
-import time
+from functools import lru_cache
 from pathlib import Path
-from urllib.parse import unquote
+from urllib.parse import parse_qs, unquote, urlsplit
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+except ImportError:  # watchdog is optional, fall back to a stat loop
+    FileSystemEventHandler = object  # type: ignore[misc,assignment]
+    Observer = PollingObserver = None  # type: ignore[misc,assignment]
 
-RELOAD_SCRIPT = """<script>
-(function() {
-    let mtimes = {};
+
+RELOAD_SCRIPT = """(function() {
+    let etag = document.currentScript.dataset.etag || null;
     function check() {
-        fetch('/.mtimes', {cache: 'no-cache'})
-            .then(r => r.json())
-            .then(newMtimes => {
-                if (JSON.stringify(newMtimes) !== JSON.stringify(mtimes)) {
-                    mtimes = newMtimes;
-                    location.reload();
-                }
+        fetch('/.mtimes', {cache: 'no-store', headers: etag ? {'If-None-Match': etag} : {}})
+            .then(r => {
+                if (r.status !== 200) return;
+                const changed = etag !== null;
+                etag = r.headers.get('ETag');
+                if (changed) location.reload();
             }).catch(() => {});
     }
-    setInterval(check, 1000);
+    if (window.EventSource) {
+        const query = etag ? '?etag=' + encodeURIComponent(etag) : '';
+        new EventSource('/.events' + query).onmessage = () => location.reload();
+    } else {
+        setInterval(check, 1000);
+    }
 })();
-</script>"""
+"""
 
 DEFAULT_HTML = """<!DOCTYPE html>
 <html><body>
@@ -41,107 +60,480 @@ DEFAULT_HTML = """<!DOCTYPE html>
 <p>Place an index.html file in the webroot to get started.</p>
 </body></html>"""
 
+# A ".." path segment; paths without one (or escapes) map directly
+_UNSAFE = re.compile(r"(?:^|/)\.\.(?:/|$)")
+
+# Served at /.wacht.js; the version in the URL lets browsers cache it for good
+_RELOAD_JS = RELOAD_SCRIPT.encode()
+_RELOAD_JS_VERSION = hashlib.sha1(_RELOAD_JS).hexdigest()[:12]
+_RELOAD_JS_ETAG = f'"{_RELOAD_JS_VERSION}"'
+_RELOAD_JS_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Only the page's ETag is spliced in per request
+_SCRIPT_TAG_HEAD = (
+    f'<script src="/.wacht.js?v={_RELOAD_JS_VERSION}" data-etag="'.encode()
+)
+_SCRIPT_TAG_TAIL = b'" defer></script>'
+_DEFAULT_HTML = DEFAULT_HTML.encode()
+
 
-def get_mtime(webroot: str | Path) -> dict:
+# fstatat() on an open directory skips re-walking webroot for every file
+_STAT_DIR_FD = (
+    hasattr(os, "O_DIRECTORY")
+    and os.stat in os.supports_dir_fd
+    and os.listdir in os.supports_fd
+)
+
+
+def get_mtime(webroot: str | Path) -> dict[str, int]:
     """Get modification times of all files in webroot."""
-    mtime = {}
-    path = Path(webroot)
-    if path.is_dir():
-        for f in path.iterdir():
-            if f.is_file():
-                mtime[f.name] = int(f.stat().st_mtime)
+    if not _STAT_DIR_FD:
+        return _scan_mtime(webroot)
+    mtime: dict[str, int] = {}
+    try:
+        dir_fd = os.open(webroot, os.O_RDONLY | os.O_DIRECTORY)
+    except (FileNotFoundError, NotADirectoryError):
+        return mtime
+    try:
+        for name in os.listdir(dir_fd):
+            try:
+                st = os.stat(name, dir_fd=dir_fd)
+            except OSError:  # removed while scanning
+                continue
+            if stat.S_ISREG(st.st_mode):
+                mtime[name] = int(st.st_mtime)
+    finally:
+        os.close(dir_fd)
     return mtime
 
 
+def _scan_mtime(webroot: str | Path) -> dict[str, int]:
+    """Get modification times with os.scandir, for platforms without dir_fd."""
+    mtime: dict[str, int] = {}
+    try:
+        with os.scandir(webroot) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        mtime[entry.name] = int(entry.stat().st_mtime)
+                except OSError:  # removed while scanning
+                    continue
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return mtime
+
+
+class _FileIndex(FileSystemEventHandler):
+    """In-memory webroot mtimes, kept current by a background watcher.
+
+    Uses watchdog (inotify and friends) when installed, otherwise a single
+    stat loop shared by all clients. Set WACHT_POLL=1 to force polling,
+    e.g. on network filesystems that emit no change events.
+    """
+
+    # Events that do not change file contents (watchdog >= 4 reports opens)
+    IGNORED_EVENTS = ("opened", "closed_no_write")
+
+    # Seconds to collect events before publishing them, so a build tool
+    # rewriting many files at once causes one reload instead of dozens
+    debounce = 0.05
+
+    def __init__(self, webroot: str | Path, interval: float = 1.0):
+        self.webroot = str(webroot)
+        self.interval = interval
+        self.mtimes: dict[str, int] = get_mtime(self.webroot)
+        self.revision = 0
+        self._json: bytes | None = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._observer = None
+        self._timer: threading.Timer | None = None
+        self._watching = False
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Start watching webroot."""
+        polling = os.environ.get("WACHT_POLL") == "1"
+        self._watching = True
+        if Observer is None:
+            thread = threading.Thread(target=self._poll, daemon=True)
+            thread.start()
+            return
+        try:
+            self._observer = self._watch(PollingObserver if polling else Observer)
+        except OSError:
+            # inotify watch/instance limit reached
+            self._observer = self._watch(PollingObserver)
+
+    def stop(self):
+        """Stop watching webroot and release waiting clients."""
+        self.stopped.set()
+        if self._observer:
+            self._observer.stop()
+        with self._changed:
+            if self._timer:
+                self._timer.cancel()
+            self._changed.notify_all()
+
+    def wait(self, etag: str, timeout: float | None = None) -> bool:
+        """Block until the index moves past etag; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self.etag != etag or self.stopped.is_set(), timeout
+            )
+
+    @property
+    def etag(self) -> str:
+        """Validator for the current mtimes, used by conditional /.mtimes."""
+        if self._watching:
+            return f'W/"{self.revision}"'
+        # Unwatched, the revision never moves: derive it from the content
+        return f'W/"{hash(frozenset(self.mtimes.items())):x}"'
+
+    def as_json(self) -> bytes:
+        """Return mtimes as JSON, encoded once per change."""
+        with self._lock:
+            if self._json is None:
+                self._json = json.dumps(self.mtimes, separators=(",", ":")).encode()
+            return self._json
+
+    def _watch(self, observer_class):
+        observer = observer_class(timeout=self.interval)
+        observer.daemon = True
+        observer.schedule(self, self.webroot, recursive=False)
+        observer.start()
+        return observer
+
+    def on_any_event(self, event):
+        """Update the entries touched by a watchdog event."""
+        if event.is_directory or event.event_type in self.IGNORED_EVENTS:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        with self._changed:
+            # Swap in a new dict so readers never see one mid-update
+            mtimes = dict(self.mtimes)
+            for path in filter(None, paths):
+                name = os.path.basename(os.fsdecode(path))
+                try:
+                    mtimes[name] = int(os.stat(path).st_mtime)
+                except OSError:
+                    mtimes.pop(name, None)
+            self.mtimes = mtimes
+            # Fixed window from the first event: a file written nonstop
+            # must not hold back reloads forever
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._publish)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _publish(self) -> None:
+        """Bump the revision for the events collected so far."""
+        with self._changed:
+            self._timer = None
+            self.revision += 1
+            self._json = None
+            self._changed.notify_all()
+
+    def _poll(self):
+        """Rescan webroot every interval (used without watchdog)."""
+        while not self.stopped.wait(self.interval):
+            self.rescan()
+
+    def rescan(self) -> None:
+        """Rescan webroot, bumping the revision if anything changed."""
+        mtimes = get_mtime(self.webroot)
+        with self._changed:
+            if mtimes != self.mtimes:
+                self.mtimes = mtimes
+                self.revision += 1
+                self._json = None
+                self._changed.notify_all()
+
+
+@lru_cache(maxsize=256)
+def _mime(ext: str) -> str:
+    """Guess a content type from a lowercase file extension."""
+    return (
+        http.server.SimpleHTTPRequestHandler.extensions_map.get(ext)
+        or mimetypes.guess_type(f"file{ext}")[0]
+        or "application/octet-stream"
+    )
+
+
+# Worth gzipping: text formats between these sizes (bytes)
+_COMPRESSIBLE = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+_GZIP_MIN_SIZE = 256
+_GZIP_MAX_SIZE = 4 * 1024 * 1024
+
+
+_GZIP_CACHE_SIZE = 64
+
+# path -> (mtime_ns, size, gzipped bytes); a new version replaces the old
+_gzip_cache: dict[str, tuple[int, int, bytes]] = {}
+_gzip_lock = threading.Lock()
+
+
+def _gzip_file(path: str, mtime_ns: int, size: int) -> bytes:
+    """Gzip a file, caching only its latest version."""
+    with _gzip_lock:
+        cached = _gzip_cache.get(path)
+    if cached and cached[:2] == (mtime_ns, size):
+        return cached[2]
+
+    buf = io.BytesIO()
+    with open(path, "rb") as f, gzip.GzipFile(
+        fileobj=buf, mode="wb", compresslevel=1
+    ) as gz:
+        shutil.copyfileobj(f, gz, 64 * 1024)
+    data = buf.getvalue()
+
+    with _gzip_lock:
+        _gzip_cache.pop(path, None)
+        if len(_gzip_cache) >= _GZIP_CACHE_SIZE:
+            # Evict the least recently stored path
+            del _gzip_cache[next(iter(_gzip_cache))]
+        _gzip_cache[path] = (mtime_ns, size, data)
+    return data
+
+
+@lru_cache(maxsize=1)
 def get_pid_file() -> Path:
-    """Get path to PID file."""
+    """Get path to PID file (its directory is created when writing)."""
     runtime = os.environ.get("XDG_RUNTIME_DIR")
     pid_dir = Path(runtime) / "wacht" if runtime else Path("/tmp/wacht")
-    pid_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
     return pid_dir / "wacht.pid"
 
 
 class ReloadHandler(http.server.SimpleHTTPRequestHandler):
     """HTTP handler with live reload injection."""
 
-    def __init__(self, *args, webroot=".", **kwargs):
-        self.webroot = Path(webroot).resolve()
+    # Seconds between comments on idle event streams, to notice dead clients
+    keepalive = 15.0
+
+    def __init__(
+        self,
+        *args,
+        webroot: Path,
+        index: _FileIndex,
+        webroot_str: str | None = None,
+        **kwargs,
+    ):
+        # Resolved once by ReloadServer, not per request
+        self.webroot = webroot
+        self._webroot_str = webroot_str or str(webroot)
+        self.index = index
         super().__init__(*args, **kwargs)
 
-    def end_headers(self):
-        self.send_header("Cache-Control", "no-cache")
-        super().end_headers()
-
     def translate_path(self, path: str) -> str:
         """Translate URL path to filesystem path."""
-        path = unquote(path).split("?")[0].split("#")[0]
-        path = os.path.normpath(path)
+        path = path.split("?", 1)[0].split("#", 1)[0]
+        if (
+            path.startswith("/")
+            and "%" not in path
+            and "\\" not in path
+            and not _UNSAFE.search(path)
+        ):
+            return self._webroot_str + path
+        path = os.path.normpath(unquote(path))
         words = [w for w in path.split("/") if w and w not in (".", "..")]
         return str(self.webroot.joinpath(*words)) if words else str(self.webroot)
 
-    def do_GET(self):
+    def do_GET(self) -> None:
         """Handle GET requests."""
-        if self.path == "/.mtimes":
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        if path == "/.mtimes":
             return self._serve_mtimes()
-        if self.path == "/":
+        if path == "/.events":
+            return self._serve_events()
+        if path == "/.wacht.js":
+            return self._serve_script()
+        if path == "/":
             return self._serve_index()
-        if self.path.endswith((".html", ".htm")):
+        if path.endswith((".html", ".htm")):
             return self._serve_html()
         return self._serve_file()
 
-    def _serve_mtimes(self):
-        """Return JSON with file modification times."""
+    def _serve_mtimes(self) -> None:
+        """Return JSON with file modification times, or 304 if unchanged."""
+        etag = self.index.etag
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            return self.end_headers()
+        data = self.index.as_json()
         self.send_response(200)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
         self.end_headers()
-        self.wfile.write(json.dumps(get_mtime(str(self.webroot))).encode())
+        self.wfile.write(data)
 
-    def _serve_index(self):
+    def _serve_events(self) -> None:
+        """Push a reload event (Server-Sent Events) whenever files change."""
+        query = parse_qs(urlsplit(self.path).query)
+        etag = query.get("etag", [self.index.etag])[0]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while not self.index.stopped.is_set():
+                if not self.index.wait(etag, self.keepalive):
+                    self.wfile.write(b": keepalive\n\n")
+                    continue
+                if self.index.stopped.is_set():
+                    # Server going down: end the stream, don't reload pages
+                    break
+                etag = self.index.etag
+                self.wfile.write(b"data: reload\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _serve_script(self) -> None:
+        """Serve the reload script, cacheable until wacht itself changes."""
+        if self.headers.get("If-None-Match") == _RELOAD_JS_ETAG:
+            self.send_response(304)
+            self.send_header("ETag", _RELOAD_JS_ETAG)
+            self.send_header("Cache-Control", _RELOAD_JS_CACHE_CONTROL)
+            return self.end_headers()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/javascript")
+        self.send_header("Content-Length", str(len(_RELOAD_JS)))
+        self.send_header("ETag", _RELOAD_JS_ETAG)
+        self.send_header("Cache-Control", _RELOAD_JS_CACHE_CONTROL)
+        self.end_headers()
+        self.wfile.write(_RELOAD_JS)
+
+    def _serve_index(self) -> None:
         """Serve index.html or show default page."""
+        mtimes = self.index.mtimes  # regular files only, no syscall needed
         for name in ("index.html", "index.htm"):
-            if (self.webroot / name).is_file():
+            if name in mtimes:
                 self.path = f"/{name}"
                 return self._serve_html()
-        self._serve_html(content=DEFAULT_HTML)
+        self._serve_html(content=_DEFAULT_HTML)
 
-    def _serve_html(self, content: str | None = None):
-        """Serve HTML with reload script injected."""
+    def _serve_html(self, content: bytes | None = None) -> None:
+        """Serve HTML with a reload script tag injected."""
         path = self.translate_path(self.path)
         if content is None:
             try:
-                content = Path(path).read_text()
-            except FileNotFoundError:
+                content = Path(path).read_bytes()
+            except (FileNotFoundError, IsADirectoryError):
                 return self.send_error(404)
 
-        mtimes = get_mtime(str(self.webroot))
-        script = RELOAD_SCRIPT.replace(
-            "let mtimes = {}", f"let mtimes = {json.dumps(mtimes)}"
-        )
+        # The page's ETag lets the script catch changes made before it runs
+        etag = html.escape(self.index.etag).encode()
+        script = _SCRIPT_TAG_HEAD + etag + _SCRIPT_TAG_TAIL
 
-        if "</body>" in content:
-            content = content.replace("</body>", f"{script}</body>")
+        head, body_end, tail = content.rpartition(b"</body>")
+        if body_end:
+            data = head + script + body_end + tail
         else:
-            content = content + script
+            data = content + script
+
+        gzipped = self._accepts_gzip() and len(data) >= _GZIP_MIN_SIZE
+        if gzipped:
+            data = gzip.compress(data, compresslevel=1)
 
-        data = content.encode()
         self.send_response(200)
         self.send_header("Content-type", "text/html")
         self.send_header("Content-Length", str(len(data)))
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", "no-cache")
         self.end_headers()
         self.wfile.write(data)
 
-    def _serve_file(self):
-        """Serve static files."""
+    def _accepts_gzip(self) -> bool:
+        """Check whether the client accepts gzip-encoded responses."""
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        """Check the request's validators against the current file."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return etag in tags or "*" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and int(mtime) <= since.timestamp()
+
+    def _serve_file(self) -> None:
+        """Serve static files, answering revalidations with 304."""
         path = self.translate_path(self.path)
         try:
-            data = Path(path).read_bytes()
+            st = os.stat(path)
+        except OSError:
+            return self.send_error(404)
+        if not stat.S_ISREG(st.st_mode):
+            return self.send_error(404)
+
+        content_type = _mime(os.path.splitext(path)[1].lower())
+        compressible = content_type.startswith(_COMPRESSIBLE)
+        gzipped = (
+            compressible
+            and _GZIP_MIN_SIZE <= st.st_size <= _GZIP_MAX_SIZE
+            and self._accepts_gzip()
+        )
+
+        # Each encoding is its own representation, with its own ETag
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-gz" if gzipped else ""}"'
+        if self._not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            if compressible:
+                self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Cache-Control", "no-cache")
+            return self.end_headers()
+
+        if gzipped:
+            try:
+                data = _gzip_file(path, st.st_mtime_ns, st.st_size)
+            except OSError:
+                return self.send_error(404)
             self.send_response(200)
-            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Type", content_type)
             self.send_header("Content-Length", str(len(data)))
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+            self.send_header("Cache-Control", "no-cache")
             self.end_headers()
             self.wfile.write(data)
-        except (FileNotFoundError, IsADirectoryError):
-            self.send_error(404)
+            return
+
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return self.send_error(404)
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(st.st_size))
+            if compressible:
+                self.send_header("Vary", "Accept-Encoding")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+            # Cache, but revalidate: edited assets must show up on reload
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            # os.sendfile where available, plain send() otherwise
+            self.connection.sendfile(f, 0, st.st_size)
 
 
 class ReloadServer:
@@ -150,14 +542,24 @@ class ReloadServer:
     def __init__(self, port: int = 8080, webroot: str | Path = ".", log=None):
         self.port = port
         self.webroot = Path(webroot).resolve()
+        self._webroot_str = str(self.webroot)
         self.log = log or sys.stdout
-        self._server: socketserver.TCPServer | None = None
+        self._server: http.server.ThreadingHTTPServer | None = None
         self._pid_file: Path | None = None
+        # Built in _serve(): stopping or spawning a daemon needs no scan
+        self._index: _FileIndex | None = None
         self._shutdown_event = threading.Event()
 
     def _handler_factory(self, *args, **kwargs):
-        """Create handler with webroot preset."""
-        return ReloadHandler(*args, webroot=str(self.webroot), **kwargs)
+        """Create handler sharing the server's webroot and file index."""
+        assert self._index is not None, "handlers are only created by _serve()"
+        return ReloadHandler(
+            *args,
+            webroot=self.webroot,
+            webroot_str=self._webroot_str,
+            index=self._index,
+            **kwargs,
+        )
 
     def start(self, daemon: bool = False):
         """Start the server."""
@@ -169,10 +571,32 @@ class ReloadServer:
                 sys.exit(1)
             print(f"Starting daemon...", file=sys.stdout)
             sys.stdout.flush()
+            if hasattr(os, "posix_spawn"):
+                pid = self._spawn_daemon()
+                # Written before returning, so an immediate --stop finds it
+                self._write_pid_file(pid)
+                print(f"Daemon {pid} started", file=sys.stdout)
+                return
             self._daemonize()
             # Write PID file AFTER daemonizing (grandchild process)
-            self._pid_file.write_text(str(os.getpid()))
+            self._write_pid_file(os.getpid())
+
+        self._serve(daemon)
+
+    def _write_pid_file(self, pid: int):
+        """Write the daemon PID, creating the PID directory if needed."""
+        pid_file = get_pid_file()
+        pid_file.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        pid_file.write_text(str(pid))
+
+    def _run_detached(self):
+        """Run the server in the process spawned by start(daemon=True)."""
+        os.chdir("/")
+        self._pid_file = get_pid_file()
+        self._serve(daemon=True)
 
+    def _serve(self, daemon: bool):
+        """Serve until a shutdown signal arrives."""
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._shutdown)  # Ctrl+C
         signal.signal(signal.SIGTERM, self._shutdown)  # kill, systemctl stop
@@ -181,9 +605,12 @@ class ReloadServer:
         # Ignore SIGPIPE (broken pipe from client disconnect)
         signal.signal(signal.SIGPIPE, signal.SIG_IGN)
 
-        socketserver.TCPServer.allow_reuse_address = True
         try:
-            self._server = socketserver.TCPServer(
+            # Scan here, after any daemonizing, so no change goes unseen
+            self._index = _FileIndex(self.webroot)
+
+            # Threaded: event streams stay open for the lifetime of a page
+            self._server = http.server.ThreadingHTTPServer(
                 ("", self.port), self._handler_factory
             )
             if not daemon:
@@ -191,18 +618,20 @@ class ReloadServer:
                 print(f"Webroot: {self.webroot}", file=self.log)
                 print("Press Ctrl+C to stop", file=self.log)
 
+            # Watch webroot before accepting clients
+            self._index.start()
+
             # Start server in a thread so we can respond to signals
             server_thread = threading.Thread(target=self._server.serve_forever)
             server_thread.daemon = True
             server_thread.start()
 
-            # Wait for shutdown signal
-            while not self._shutdown_event.is_set():
-                time.sleep(0.1)
+            # Block until a shutdown signal sets the event
+            self._shutdown_event.wait()
 
         except OSError as e:
             print(f"Error: Port {self.port} unavailable ({e})", file=self.log)
-            if daemon and self._pid_file.exists():
+            if daemon and self._pid_file and self._pid_file.exists():
                 self._pid_file.unlink()
             sys.exit(1)
 
@@ -225,8 +654,37 @@ class ReloadServer:
             print(f"Permission denied to kill {pid}", file=sys.stderr)
             raise SystemExit(1)
 
+    def _spawn_daemon(self) -> int:
+        """Spawn a detached copy of this server, returning its PID."""
+        if getattr(sys, "frozen", False):  # PyInstaller binary
+            argv = [sys.executable]
+        else:
+            argv = [sys.executable, "-m", "wacht"]
+        # Log to the same file; "<stdout>" would be /dev/null in the child
+        log = getattr(self.log, "name", "<>")
+        log = os.path.abspath(log) if not log.startswith("<") else "null"
+        argv += ["--detached", "-p", str(self.port), "-l", log, str(self.webroot)]
+
+        # Let "-m wacht" find this package even when it isn't installed
+        env = dict(os.environ)
+        root = str(Path(__file__).resolve().parent.parent)
+        paths = [root, env.get("PYTHONPATH", "")]
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, paths))
+
+        return os.posix_spawn(
+            argv[0],
+            argv,
+            env,
+            file_actions=[
+                (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+                (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_DUP2, 1, 2),
+            ],
+            setsid=True,
+        )
+
     def _daemonize(self):
-        """Double-fork daemonize."""
+        """Double-fork daemonize (fallback without posix_spawn)."""
         try:
             if os.fork() > 0:
                 sys.exit(0)
@@ -261,6 +719,9 @@ class ReloadServer:
         # Signal the main loop to exit
         self._shutdown_event.set()
 
+        if self._index:
+            self._index.stop()
+
         # Clean shutdown
         if self._server:
             try:
@@ -299,6 +760,8 @@ def main():
     )
     parser.add_argument("-d", "--daemon", action="store_true", help="Run as daemon")
     parser.add_argument("-s", "--stop", action="store_true", help="Stop daemon")
+    # Internal: set on the process spawned by --daemon
+    parser.add_argument("--detached", action="store_true", help=argparse.SUPPRESS)
     parser.add_argument(
         "-v", "--version", action="version", version=f"wacht {__version__}"
     )
@@ -313,6 +776,8 @@ def main():
 
     if args.stop:
         server.stop()
+    elif args.detached:
+        server._run_detached()
     else:
         server.start(daemon=args.daemon)
 
@@ -0,0 +1,6 @@
+"""Allow running wacht as ``python -m wacht``."""
+
+from wacht import main
+
+if __name__ == "__main__":
+    main()